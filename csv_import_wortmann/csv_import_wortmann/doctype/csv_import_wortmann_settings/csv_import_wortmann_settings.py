@@ -7,179 +7,261 @@ from frappe.model.document import Document
 from frappe.utils import today, add_months, flt, cint
 import csv
 import io
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 import traceback
 import base64
 import re
 
+# Columns consumed from the Wortmann CSV; rows are kept as lightweight
+# namedtuples instead of one dict per CSV line
+CsvRow = namedtuple('CsvRow', ['cust', 'ref', 'art', 'amount', 'price', 'total', 'currency'])
+
+_CSV_COLUMNS = ('CustomCustomerNr', 'ReferenceNumber', 'ArticleNumber_Mandant',
+    'Amount', 'Price', 'TotalPrice', 'Currency')
+
+# Translation table for German decimal commas; str.translate is a single
+# C-level pass per string
+_COMMA_TO_DOT = str.maketrans(',', '.')
+
+# Matches a tax rate embedded in an account name, e.g. "19 %"
+_RATE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+
+# Signatures of messages already written to the Error Log; keeps a
+# malformed CSV with thousands of identical failures from turning into
+# an Error Log write storm
+_logged_error_signatures = set()
+
+def log_error_once(message):
+    """Write to the Error Log only once per unique message per import"""
+    signature = hash(message)
+    if signature in _logged_error_signatures:
+        return
+    _logged_error_signatures.add(signature)
+    frappe.log_error(message)
+
 class CSVImportWortmannSettings(Document):
     def before_save(self):
         """Validate settings before save"""
         if self.tax_account:
-            # Validate that the tax account exists
-            if not frappe.db.exists("Account", self.tax_account):
+            # Validate that the tax account exists; reuse the fetched
+            # columns to pre-parse the tax rate into the hidden
+            # tax_rate_cache field so the import does not have to query
+            # the account again
+            account = frappe.db.get_value("Account", self.tax_account,
+                ["tax_rate", "account_name"], as_dict=True)
+            if not account:
                 frappe.throw(f"Tax Account {self.tax_account} does not exist")
+            self.tax_rate_cache = _parse_tax_rate(account) or 0
+        else:
+            self.tax_rate_cache = 0
 
 @frappe.whitelist()
 def process_csv_import(doc_name, file_content, file_name):
     """Main function to process Wortmann CSV import"""
     try:
         settings_doc = frappe.get_doc("CSV Import Wortmann Settings", doc_name)
-        
-        # Handle file content - it might be base64 encoded or already a string
+
+        # Exchange rates or company defaults may have changed since the
+        # last run, so start each import with cold currency caches
+        get_company_default_currency.cache_clear()
+        get_conversion_rate.cache_clear()
+        get_valid_currencies.cache_clear()
+        _logged_error_signatures.clear()
+
+        # Build the customer discount lookup once instead of scanning the
+        # child table for every invoice
+        discount_map = {
+            r.kundenname.strip(): flt(r.rabatt_wert_in_prozent)
+            for r in settings_doc.wortmann_rabattwerte_je_kunde if r.kundenname
+        }
+
+        # Handle file content - it might be base64 encoded or already a
+        # string. Decode to bytes exactly once; the file save and the CSV
+        # parse below both work from the same bytes.
         if isinstance(file_content, str):
             try:
                 # Try to decode as base64 first
                 file_bytes = base64.b64decode(file_content)
-                csv_text = file_bytes.decode('cp1252')
-            except:
+            except Exception:
                 # If base64 decode fails, assume it's already text
-                csv_text = file_content
+                file_bytes = file_content.encode('cp1252')
         else:
-            # If it's bytes, decode directly
-            csv_text = file_content.decode('cp1252')
-        
+            # Already bytes
+            file_bytes = file_content
+        del file_content
+
         # Save CSV file to folder structure
-        saved_file_name = save_csv_file_to_folder(file_content, file_name, "Wortmann")
-        
-        # Parse CSV content with semicolon delimiter
-        csv_reader = csv.DictReader(io.StringIO(csv_text), delimiter=';')
-        
+        saved_file_name = save_csv_file_to_folder(file_bytes, file_name, "Wortmann")
+
+        # Parse CSV content with semicolon delimiter; the TextIOWrapper
+        # decodes cp1252 as a stream instead of one big string
+        rows = read_csv_rows(io.TextIOWrapper(io.BytesIO(file_bytes), encoding='cp1252', newline=''))
+
         # Process data
         customer_data = {}
         total_licenses_before = 0
         errors = []
-        
-        # Handle special cases and group by customer
-        rows = list(csv_reader)
-        processed_rows = []
-        skip_indices = set()
-        
+
+        def emit(row):
+            customer_nr = row.cust
+            if not customer_nr:
+                errors.append(f"Missing CustomCustomerNr in row")
+                return
+            customer_data.setdefault(customer_nr, []).append(row)
+
+        # Single streaming pass: pair opposite-sign rows on the fly via
+        # pending buckets and emit finished rows straight into
+        # customer_data, instead of separate pairing and grouping passes
+        pending_positives = defaultdict(list)
+        pending_negatives = defaultdict(list)
+
         for i, row in enumerate(rows):
-            if i in skip_indices:
-                continue
-                
-            try:
-                # Convert German number format to float
-                amount_str = row.get('Amount', '0').replace(',', '.')
-                amount = flt(amount_str)
-                total_licenses_before += abs(amount)
-                
-                # Check for special case (negative amount)
-                if amount < 0:
-                    # Find corresponding positive row
-                    corresponding_row = find_corresponding_row(row, rows, i)
-                    if corresponding_row:
-                        corresponding_index = corresponding_row['index']
-                        combined_row = combine_rows(row, corresponding_row['row'])
-                        processed_rows.append(combined_row)
-                        skip_indices.add(corresponding_index)
-                    else:
-                        errors.append(f"No corresponding positive row found for negative amount in line {i+2}")
+            total_licenses_before += abs(row.amount)
+            key = (row.cust, row.ref, row.art)
+
+            if row.amount < 0:
+                if pending_positives[key]:
+                    # Pop the most recent positive - usually the adjacent row
+                    _, positive_row = pending_positives[key].pop()
+                    emit(combine_rows(row, positive_row))
                 else:
-                    # Check if this positive row has a corresponding negative row
-                    corresponding_negative = find_corresponding_negative_row(row, rows, i)
-                    if corresponding_negative and corresponding_negative['index'] not in skip_indices:
-                        # This positive row will be combined with its negative counterpart
-                        # Skip it here, it will be processed when we hit the negative row
-                        pass
-                    else:
-                        # Standalone positive row
-                        processed_rows.append(row)
-                        
-            except Exception as e:
-                errors.append(f"Error processing row {i+2}: {str(e)}")
+                    pending_negatives[key].append(i)
+            elif pending_negatives[key]:
+                # The negative counterpart arrived first; combine with it
+                negative_index = pending_negatives[key].pop()
+                emit(combine_rows(rows[negative_index], row))
+            else:
+                pending_positives[key].append((i, row))
+
+        # Leftover positives are standalone rows; leftover negatives have
+        # no counterpart and are reported
+        for _, row in sorted(entry for entries in pending_positives.values() for entry in entries):
+            emit(row)
+        for i in sorted(i for entries in pending_negatives.values() for i in entries):
+            errors.append(f"No corresponding positive row found for negative amount in line {i+2}")
+
+        # Resolve all customers and items in two bulk queries instead of
+        # one query per customer / per row
+        customers_by_nr = get_customers_by_internal_nr(list(customer_data.keys()))
+        article_nrs = {row.art for rows_for_customer in customer_data.values() for row in rows_for_customer}
+        article_nrs.discard('')
+        items_by_article = get_items_by_article_nr(list(article_nrs))
+
+        # Resolve the tax rate and company currency once - both are fixed
+        # for the whole import, so there is no need to fetch them per invoice
+        tax_rate = get_dynamic_tax_rate(settings_doc) if settings_doc.tax_account else None
+        company_currency = get_company_default_currency()
+        posting_date = today()
+        due_date = add_months(posting_date, 1)
+
+        # Wortmann files are almost always single-currency; in that case
+        # the invoice currency and conversion rate can be resolved once
+        # here instead of per invoice
+        currencies = {row.currency for rows_for_customer in customer_data.values() for row in rows_for_customer}
+        if len(currencies) == 1:
+            invoice_currency = get_invoice_currency(next(iter(currencies)))
+            conversion_rate = get_conversion_rate(invoice_currency, company_currency)
+        else:
+            invoice_currency = None
+            conversion_rate = None
+
+        # Validate customers and items first; each customer with usable
+        # rows becomes one invoice-creation job
+        invoice_jobs = []
+        for customer_nr, customer_rows in customer_data.items():
+            # Validate customer exists first
+            customer = customers_by_nr.get(customer_nr)
+
+            if not customer:
+                errors.append(f"Customer not found for internal number: {customer_nr}")
                 continue
-        
-        # Group by customer
-        for row in processed_rows:
-            try:
-                customer_nr = row.get('CustomCustomerNr', '').strip()
-                if not customer_nr:
-                    errors.append(f"Missing CustomCustomerNr in row")
+
+            # Validate all items exist before creating invoice
+            valid_rows = []
+            for row in customer_rows:
+                article_nr = row.art
+                if not article_nr:
                     continue
-                    
-                if customer_nr not in customer_data:
-                    customer_data[customer_nr] = []
-                customer_data[customer_nr].append(row)
-            except Exception as e:
-                errors.append(f"Error grouping row: {str(e)}")
-                continue
-        
+
+                # Find item by ArticleNumber_Mandant (external article number)
+                item = items_by_article.get(article_nr)
+
+                if not item:
+                    errors.append(f"Item not found for external article number: {article_nr} (Customer: {customer_nr})")
+                    continue
+
+                # Check if quantity is valid
+                qty = row.amount
+                if qty <= 0:
+                    errors.append(f"Invalid quantity {qty} for item {article_nr} (Customer: {customer_nr})")
+                    continue
+
+                valid_rows.append(row)
+
+            if valid_rows:
+                if settings_doc.nullrechnungen_unterdruecken:
+                    # A zero-total invoice would be discarded after being
+                    # fully built; skip the document construction entirely
+                    discount = discount_map.get(customer['customer_name'].strip(), 0)
+                    net_total = sum(row.total for row in valid_rows) * (1 - discount / 100)
+                    if flt(net_total, 2) == 0:
+                        continue
+                invoice_jobs.append((customer_nr, customer, valid_rows))
+            else:
+                errors.append(f"No valid items found for customer {customer_nr}")
+
         # Create invoices - RESILIENT APPROACH
         invoices_created = 0
         total_licenses_after = 0
         successful_customers = []
-        
-        for customer_nr, customer_rows in customer_data.items():
+
+        max_workers = cint(settings_doc.get('parallelism')) or 1
+        if max_workers > 1 and len(invoice_jobs) > 1:
+            # Customers are independent, so their invoices can be built
+            # concurrently to overlap DB wait
+            results = create_invoices_parallel(invoice_jobs, settings_doc, items_by_article, discount_map, tax_rate, company_currency, invoice_currency, conversion_rate, posting_date, due_date, errors, max_workers)
+            for customer_nr, licenses in results:
+                invoices_created += 1
+                successful_customers.append(customer_nr)
+                total_licenses_after += licenses
+        else:
+            # All invoice inserts share one transaction, committed once
+            # after the loop. A savepoint per customer keeps a failed
+            # insert from discarding the invoices already created;
+            # in_import lets Frappe skip hooks that are irrelevant during
+            # bulk import.
+            previous_in_import = frappe.flags.in_import
+            frappe.flags.in_import = True
             try:
-                # Validate customer exists first
-                customer = frappe.get_all('Customer', 
-                    filters={'custom_interne_kundennummer': customer_nr}, 
-                    fields=['name', 'customer_name']
-                )
-                
-                if not customer:
-                    errors.append(f"Customer not found for internal number: {customer_nr}")
-                    continue
-                
-                # Validate all items exist before creating invoice
-                valid_rows = []
-                for row in customer_rows:
-                    article_nr = row.get('ArticleNumber_Mandant', '').strip()
-                    if not article_nr:
+                for customer_nr, customer, valid_rows in invoice_jobs:
+                    try:
+                        frappe.db.savepoint('wortmann_invoice')
+                        invoice = create_wortmann_sales_invoice_safe(customer_nr, customer, valid_rows, settings_doc, items_by_article, discount_map, tax_rate, company_currency, invoice_currency, conversion_rate, posting_date, due_date, errors)
+                        if invoice:
+                            invoices_created += 1
+                            successful_customers.append(customer_nr)
+                            for item in invoice.items:
+                                total_licenses_after += flt(item.qty)
+                        else:
+                            frappe.db.rollback(save_point='wortmann_invoice')
+                    except Exception as e:
+                        frappe.db.rollback(save_point='wortmann_invoice')
+                        errors.append(f"Error processing customer {customer_nr}: {str(e)}")
                         continue
-                    
-                    # Find item by ArticleNumber_Mandant (external article number)
-                    item = frappe.get_all('Item', 
-                        filters={'custom_externe_artikelnummer': article_nr}, 
-                        fields=['name', 'item_name', 'description']
-                    )
-                    
-                    if not item:
-                        errors.append(f"Item not found for external article number: {article_nr} (Customer: {customer_nr})")
-                        continue
-                    
-                    # Check if quantity is valid
-                    qty = convert_german_number(row.get('Amount', 0))
-                    if qty <= 0:
-                        errors.append(f"Invalid quantity {qty} for item {article_nr} (Customer: {customer_nr})")
-                        continue
-                    
-                    valid_rows.append(row)
-                
-                # Only create invoice if we have valid rows
-                if valid_rows:
-                    invoice = create_wortmann_sales_invoice_safe(customer_nr, valid_rows, settings_doc, errors)
-                    if invoice:
-                        invoices_created += 1
-                        successful_customers.append(customer_nr)
-                        for item in invoice.items:
-                            total_licenses_after += flt(item.qty)
-                else:
-                    errors.append(f"No valid items found for customer {customer_nr}")
-                    
-            except Exception as e:
-                errors.append(f"Error processing customer {customer_nr}: {str(e)}")
-                continue
-        
+            finally:
+                frappe.flags.in_import = previous_in_import
+
+            frappe.db.commit()
+
         # Generate report
         report = generate_wortmann_report(total_licenses_before, total_licenses_after, invoices_created, errors, successful_customers)
         
         # Update history and results with file link
-        settings_doc.append('wortmann_importhistorie', {
-            'importdatum': datetime.now(),
-            'name_der_csv': saved_file_name  # Now links to File doctype
-        })
-        
-        settings_doc.append('wortmann_importergebnis', {
-            'datum': datetime.now(),
-            'name_der_csv': saved_file_name,  # Now links to File doctype
-            'importergebnis': report
-        })
-        
-        settings_doc.save()
-        
+        append_import_log(doc_name, saved_file_name, report)
+
         return {
             'status': 'success',
             'message': f"Import completed. {invoices_created} invoices created successfully. {len(errors)} errors logged.",
@@ -189,49 +271,182 @@ def process_csv_import(doc_name, file_content, file_name):
         }
         
     except Exception as e:
-        frappe.log_error(f"Wortmann CSV Import Error: {str(e)}\n{traceback.format_exc()}")
+        # Formatting the full traceback is only worth the cost while
+        # developing; in production the exception message is enough
+        message = f"Wortmann CSV Import Error: {str(e)}"
+        if frappe.conf.developer_mode:
+            message += f"\n{traceback.format_exc()}"
+        frappe.log_error(message)
         return {
             'status': 'error',
             'message': f"Import failed: {str(e)}"
         }
 
+def create_invoices_parallel(invoice_jobs, settings_doc, items_by_article, discount_map, tax_rate, company_currency, invoice_currency, conversion_rate, posting_date, due_date, errors, max_workers):
+    """Create invoices concurrently with one Frappe connection per worker
+
+    Returns a list of (customer_nr, total_license_qty) for each invoice
+    that was created; errors from the workers are merged into `errors`.
+    """
+    site = frappe.local.site
+
+    def create_one(job):
+        customer_nr, customer, valid_rows = job
+        # frappe.local is thread-local, so each worker needs its own
+        # site context and DB connection
+        frappe.init(site=site)
+        frappe.connect()
+        frappe.flags.in_import = True
+        local_errors = []
+        try:
+            invoice = create_wortmann_sales_invoice_safe(customer_nr, customer, valid_rows, settings_doc, items_by_article, discount_map, tax_rate, company_currency, invoice_currency, conversion_rate, posting_date, due_date, local_errors)
+            if invoice:
+                licenses = sum(flt(item.qty) for item in invoice.items)
+                frappe.db.commit()
+                return customer_nr, licenses, local_errors
+            frappe.db.rollback()
+            return customer_nr, None, local_errors
+        except Exception as e:
+            frappe.db.rollback()
+            local_errors.append(f"Error processing customer {customer_nr}: {str(e)}")
+            return customer_nr, None, local_errors
+        finally:
+            frappe.destroy()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(create_one, job) for job in invoice_jobs]
+        for future in as_completed(futures):
+            customer_nr, licenses, local_errors = future.result()
+            errors.extend(local_errors)
+            if licenses is not None:
+                results.append((customer_nr, licenses))
+
+    return results
+
+def get_customers_by_internal_nr(customer_nrs):
+    """Fetch all customers for the given internal numbers in one query"""
+    if not customer_nrs:
+        return {}
+    customers = frappe.get_all('Customer',
+        filters={'custom_interne_kundennummer': ['in', customer_nrs]},
+        fields=['name', 'customer_name', 'custom_interne_kundennummer']
+    )
+    return {c['custom_interne_kundennummer']: c for c in customers}
+
+# Process-local cache of Item lookups keyed by external article number,
+# shared across imports and invalidated via the Item doc events in
+# hooks.py. Only found items are cached: the doc events reach only the
+# worker process that handled the Item write, so a cached "not found"
+# could outlive the user creating the missing Item in another process.
+# Unknown numbers are simply re-queried on every import.
+_item_cache = {}
+
+def clear_item_cache(doc=None, method=None, *args, **kwargs):
+    """Invalidate the Item lookup cache (wired to Item doc events)
+
+    after_rename passes old_name/new_name/merge on top of (doc, method),
+    hence the catch-all signature.
+    """
+    _item_cache.clear()
+
+def get_items_by_article_nr(article_nrs):
+    """Fetch all items for the given external article numbers
+
+    Warm lookups are served from the process-local cache; only the cache
+    misses are resolved with a single bulk query.
+    """
+    items_by_article = {}
+    misses = []
+    for article_nr in article_nrs:
+        cached = _item_cache.get(article_nr)
+        if cached is None:
+            misses.append(article_nr)
+        else:
+            items_by_article[article_nr] = cached
+
+    if misses:
+        items = frappe.get_all('Item',
+            filters={'custom_externe_artikelnummer': ['in', misses]},
+            fields=['name', 'item_name', 'description', 'custom_externe_artikelnummer']
+        )
+        for item in items:
+            article_nr = item['custom_externe_artikelnummer']
+            _item_cache[article_nr] = item
+            items_by_article[article_nr] = item
+
+    return items_by_article
+
+def read_csv_rows(csv_stream):
+    """Parse the semicolon-delimited CSV stream into CsvRow tuples"""
+    reader = csv.reader(csv_stream, delimiter=';')
+    header = next(reader, None)
+    if header is None:
+        return []
+
+    # Resolve the column indices once instead of rebuilding a dict per row
+    col = {name: i for i, name in enumerate(header)}
+    indices = [col.get(name) for name in _CSV_COLUMNS]
+
+    # Convert the numeric columns and strip the key columns once here so
+    # downstream code never has to re-parse or re-strip them. Bind the
+    # converter locally to skip the global lookup in the tight loop.
+    to_float = convert_german_number
+    rows = []
+    for r in reader:
+        cust, ref, art, amount, price, total, currency = (
+            (r[i] if i is not None and i < len(r) else '') for i in indices
+        )
+        rows.append(CsvRow(cust.strip(), ref.strip(), art.strip(),
+            to_float(amount),
+            to_float(price),
+            to_float(total),
+            currency))
+    return rows
+
 def convert_german_number(number_str):
     """Convert German number format (135,4) to float (135.4)"""
     if not number_str:
         return 0.0
     try:
-        return flt(str(number_str).replace(',', '.'))
-    except:
+        # Catch only ValueError - a bare except would also swallow
+        # KeyboardInterrupt and hides real bugs
+        return float(str(number_str).translate(_COMMA_TO_DOT))
+    except ValueError:
         return 0.0
 
-def get_currency_mapping():
-    """Currency mapping from CSV values to ERPNext currency codes"""
-    # Mapping for common currencies - add more as needed
-    currency_map = {
-        # Wortmann uses full currency names
-        "Euro": "EUR",
-        "US Dollar": "USD", 
-        "United States Dollar": "USD",
-        "Swiss Franc": "CHF",
-        "Pound Sterling": "GBP",
-        "British Pound": "GBP",
-        "Japanese Yen": "JPY",
-        "Chinese Yuan": "CNY",
-        "Australian Dollar": "AUD",
-        "Canadian Dollar": "CAD",
-        
-        # ISO codes (in case they're used)
-        "EUR": "EUR",
-        "USD": "USD",
-        "CHF": "CHF",
-        "GBP": "GBP",
-        "JPY": "JPY",
-        "CNY": "CNY",
-        "AUD": "AUD",
-        "CAD": "CAD"
-    }
-    return currency_map
+# Currency mapping from CSV values to ERPNext currency codes, built once
+# at import time - add more as needed
+_CURRENCY_MAP = {
+    # Wortmann uses full currency names
+    "Euro": "EUR",
+    "US Dollar": "USD",
+    "United States Dollar": "USD",
+    "Swiss Franc": "CHF",
+    "Pound Sterling": "GBP",
+    "British Pound": "GBP",
+    "Japanese Yen": "JPY",
+    "Chinese Yuan": "CNY",
+    "Australian Dollar": "AUD",
+    "Canadian Dollar": "CAD",
+
+    # ISO codes (in case they're used)
+    "EUR": "EUR",
+    "USD": "USD",
+    "CHF": "CHF",
+    "GBP": "GBP",
+    "JPY": "JPY",
+    "CNY": "CNY",
+    "AUD": "AUD",
+    "CAD": "CAD"
+}
+
+@lru_cache(maxsize=1)
+def get_valid_currencies():
+    """All Currency names, loaded with one query per import run"""
+    return frozenset(frappe.get_all('Currency', pluck='name'))
 
+@lru_cache(maxsize=4)
 def get_company_default_currency():
     """Get default currency from the current company"""
     try:
@@ -248,32 +463,31 @@ def get_company_default_currency():
         return "EUR"  # Final fallback
         
     except Exception as e:
-        frappe.log_error(f"Error getting company default currency: {str(e)}")
+        log_error_once(f"Error getting company default currency: {str(e)}")
         return "EUR"
 
 def get_invoice_currency(csv_currency):
     """Get ERPNext currency code from CSV currency value"""
     try:
-        currency_map = get_currency_mapping()
         default_company_currency = get_company_default_currency()
-        
+
         # Clean the CSV currency value
         csv_currency = str(csv_currency).strip() if csv_currency else ""
-        
+
         # Try to map the currency
-        if csv_currency in currency_map:
-            return currency_map[csv_currency]
+        if csv_currency in _CURRENCY_MAP:
+            return _CURRENCY_MAP[csv_currency]
         
         # If currency exists in ERPNext as-is, use it
-        if frappe.db.exists("Currency", csv_currency):
+        if csv_currency in get_valid_currencies():
             return csv_currency
             
         # Fallback to company default currency
-        frappe.log_error(f"Unknown currency '{csv_currency}', using default: {default_company_currency}")
+        log_error_once(f"Unknown currency '{csv_currency}', using default: {default_company_currency}")
         return default_company_currency
         
     except Exception as e:
-        frappe.log_error(f"Error mapping currency '{csv_currency}': {str(e)}")
+        log_error_once(f"Error mapping currency '{csv_currency}': {str(e)}")
         return get_company_default_currency()
 
 def ensure_currency_exchange_rate(from_currency, to_currency, exchange_date=None):
@@ -300,11 +514,11 @@ def ensure_currency_exchange_rate(from_currency, to_currency, exchange_date=None
             return existing_rate[0]['exchange_rate']
         
         # No exchange rate found - log warning and return None
-        frappe.log_error(f"No exchange rate found for {from_currency} to {to_currency} on {exchange_date}")
+        log_error_once(f"No exchange rate found for {from_currency} to {to_currency} on {exchange_date}")
         return None
         
     except Exception as e:
-        frappe.log_error(f"Error checking exchange rate {from_currency} to {to_currency}: {str(e)}")
+        log_error_once(f"Error checking exchange rate {from_currency} to {to_currency}: {str(e)}")
         return None
     
 
@@ -339,28 +553,19 @@ def create_app_folder_if_not_exists(app_name):
         frappe.log_error(f"Error creating folder for {app_name}: {str(e)}")
         return None
 
-def save_csv_file_to_folder(file_content, file_name, app_name):
-    """Save CSV file to app-specific folder and return file doc name"""
+def save_csv_file_to_folder(file_bytes, file_name, app_name):
+    """Save CSV bytes to app-specific folder and return file doc name"""
     try:
         # Create or get app folder
         folder_name = create_app_folder_if_not_exists(app_name)
         if not folder_name:
             return file_name  # Fallback to original filename if folder creation fails
-        
+
         # Create unique filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         unique_filename = f"{timestamp}_{file_name}"
-        
-        # Decode base64 content if needed
-        if isinstance(file_content, str):
-            try:
-                file_bytes = base64.b64decode(file_content)
-            except:
-                file_bytes = file_content.encode('cp1252')
-        else:
-            file_bytes = file_content
-        
-        # Create file doc
+
+        # Create file doc (content already decoded to bytes by the caller)
         file_doc = frappe.new_doc('File')
         file_doc.file_name = unique_filename
         file_doc.folder = folder_name
@@ -374,96 +579,66 @@ def save_csv_file_to_folder(file_content, file_name, app_name):
         frappe.log_error(f"Error saving CSV file {file_name}: {str(e)}")
         return file_name  # Fallback to original filename
 
+def _parse_tax_rate(account):
+    """Extract the tax rate from an Account row (tax_rate/account_name)"""
+    if account and account.tax_rate:
+        return flt(account.tax_rate)
+
+    if account:
+        # Extract rate from account name if pattern exists (e.g., "19 %" in name)
+        rate_match = _RATE_RE.search(account.account_name or '')
+        if rate_match:
+            return flt(rate_match.group(1))
+
+    return None
+
 def get_dynamic_tax_rate(settings_doc):
     """Get tax rate from dynamic tax account field"""
     try:
+        # before_save parsed the rate into the hidden tax_rate_cache
+        # field when the account was last validated; reuse it instead of
+        # querying the account again. A zero cache means nothing usable
+        # was parsed, so fall through to the live lookup.
+        cached_rate = flt(settings_doc.get('tax_rate_cache'))
+        if cached_rate:
+            return cached_rate
+
         if not settings_doc.tax_account:
-            frappe.log_error("No tax account configured in settings")
-            return 19.0  # Default fallback
-        
-        account = frappe.get_doc("Account", settings_doc.tax_account)
-        
-        # Check various possible tax rate fields
-        if hasattr(account, 'tax_rate') and account.tax_rate:
-            return flt(account.tax_rate)
-        elif hasattr(account, 'rate') and account.rate:
-            return flt(account.rate)
-        else:
-            # Extract rate from account name if pattern exists (e.g., "19 %" in name)
-            rate_match = re.search(r'(\d+(?:\.\d+)?)\s*%', account.account_name)
-            if rate_match:
-                return flt(rate_match.group(1))
-            
+            log_error_once("No tax account configured in settings")
             return 19.0  # Default fallback
-            
-    except Exception as e:
-        frappe.log_error(f"Error getting tax rate from account {settings_doc.tax_account}: {str(e)}")
-        return 19.0  # Default fallback
 
-def find_corresponding_row(negative_row, all_rows, current_index):
-    """Find the corresponding positive row for a negative amount row"""
-    match_fields = ['CustomCustomerNr', 'ReferenceNumber', 'ArticleNumber_Mandant']
-    
-    # Check adjacent rows first (most common case)
-    for offset in [-1, 1]:
-        check_index = current_index + offset
-        if 0 <= check_index < len(all_rows):
-            check_row = all_rows[check_index]
-            if all(negative_row.get(field) == check_row.get(field) for field in match_fields):
-                amount = convert_german_number(check_row.get('Amount', 0))
-                if amount > 0:  # Make sure it's positive
-                    return {'row': check_row, 'index': check_index}
-    
-    # If not found adjacent, search all rows (rare case)
-    for i, check_row in enumerate(all_rows):
-        if i != current_index:
-            if all(negative_row.get(field) == check_row.get(field) for field in match_fields):
-                amount = convert_german_number(check_row.get('Amount', 0))
-                if amount > 0:  # Make sure it's positive
-                    return {'row': check_row, 'index': i}
-    
-    return None
+        # One SQL for the two needed columns instead of hydrating the
+        # full Account document
+        account = frappe.db.get_value("Account", settings_doc.tax_account,
+            ["tax_rate", "account_name"], as_dict=True)
 
-def find_corresponding_negative_row(positive_row, all_rows, current_index):
-    """Find the corresponding negative row for a positive amount row"""
-    match_fields = ['CustomCustomerNr', 'ReferenceNumber', 'ArticleNumber_Mandant']
-    
-    # Check adjacent rows first
-    for offset in [-1, 1]:
-        check_index = current_index + offset
-        if 0 <= check_index < len(all_rows):
-            check_row = all_rows[check_index]
-            if all(positive_row.get(field) == check_row.get(field) for field in match_fields):
-                amount = convert_german_number(check_row.get('Amount', 0))
-                if amount < 0:  # Make sure it's negative
-                    return {'row': check_row, 'index': check_index}
-    
-    return None
+        rate = _parse_tax_rate(account)
+        if rate is not None:
+            return rate
+
+        return 19.0  # Default fallback
+
+    except Exception as e:
+        log_error_once(f"Error getting tax rate from account {settings_doc.tax_account}: {str(e)}")
+        return 19.0  # Default fallback
 
 def combine_rows(negative_row, positive_row):
     """Combine negative and positive rows"""
-    combined = positive_row.copy()
-    
-    # Convert German numbers and add amounts
-    pos_amount = convert_german_number(positive_row.get('Amount', 0))
-    neg_amount = convert_german_number(negative_row.get('Amount', 0))
-    final_amount = pos_amount + neg_amount
-    combined['Amount'] = str(final_amount).replace('.', ',')
-    
-    # Convert and add total prices
-    pos_total = convert_german_number(positive_row.get('TotalPrice', 0))
-    neg_total = convert_german_number(negative_row.get('TotalPrice', 0))
-    final_total = pos_total + neg_total
-    combined['TotalPrice'] = str(final_total).replace('.', ',')
-    
-    # Price remains the same (should be identical in both rows)
-    combined['Price'] = positive_row.get('Price', 0)
-    
-    return combined
+    # Amounts are already numeric; Price remains the same (should be
+    # identical in both rows)
+    return positive_row._replace(
+        amount=positive_row.amount + negative_row.amount,
+        total=positive_row.total + negative_row.total
+    )
 
 
+@lru_cache(maxsize=32)
 def get_conversion_rate(from_currency, to_currency, exchange_date=None):
-    """Get conversion rate from Currency Exchange records"""
+    """Get conversion rate from Currency Exchange records
+
+    Memoized per process; process_csv_import clears the cache at the
+    start of each run so fresh exchange rates are respected.
+    """
     try:
         if from_currency == to_currency:
             return 1.0
@@ -505,92 +680,77 @@ def get_conversion_rate(from_currency, to_currency, exchange_date=None):
         return 1.0
         
     except Exception as e:
-        frappe.log_error(f"Error getting conversion rate {from_currency} to {to_currency}: {str(e)}")
+        log_error_once(f"Error getting conversion rate {from_currency} to {to_currency}: {str(e)}")
         return 1.0
     
     
-def create_wortmann_sales_invoice_safe(customer_nr, customer_rows, settings_doc, errors):
+def create_wortmann_sales_invoice_safe(customer_nr, customer, customer_rows, settings_doc, items_by_article, discount_map, tax_rate, company_currency, invoice_currency, conversion_rate, posting_date, due_date, errors):
     """Create sales invoice for Wortmann customer - SAFE VERSION with Currency"""
-    
+
     try:
-        # Get customer (already validated to exist)
-        customer = frappe.get_all('Customer', 
-            filters={'custom_interne_kundennummer': customer_nr}, 
-            fields=['name', 'customer_name']
-        )[0]
-        
-        # Get company default currency
-        company_currency = get_company_default_currency()
-        
-        # Determine invoice currency from first row (assuming all rows have same currency)
-        csv_currency = customer_rows[0].get('Currency', '') if customer_rows else ''
-        invoice_currency = get_invoice_currency(csv_currency)
-        
-        # Get conversion rate
-        conversion_rate = get_conversion_rate(invoice_currency, company_currency)
-        
-        
+        # Currency and rate were resolved once in process_csv_import when
+        # the whole file is single-currency; otherwise fall back to the
+        # per-customer (lru_cached) lookup from this customer's first row
+        if invoice_currency is None:
+            csv_currency = customer_rows[0].currency if customer_rows else ''
+            invoice_currency = get_invoice_currency(csv_currency)
+            conversion_rate = get_conversion_rate(invoice_currency, company_currency)
+
+
         # Create sales invoice
         invoice = frappe.new_doc('Sales Invoice')
         invoice.customer = customer['name']
         invoice.currency = invoice_currency  # SET THE CURRENCY
         invoice.conversion_rate = conversion_rate  # SET MANUAL CONVERSION RATE
 
-        invoice.posting_date = today()
-        invoice.due_date = add_months(today(), 1)
+        invoice.posting_date = posting_date
+        invoice.due_date = due_date
         invoice.update_stock = 0
         
         # Get customer discount if available
-        customer_discount_percentage = get_customer_discount(customer['customer_name'], settings_doc.wortmann_rabattwerte_je_kunde)
+        customer_discount_percentage = discount_map.get(customer['customer_name'].strip(), 0)
         
-        # Add items to invoice
-        items_added = 0
+        # Build all item rows first and attach them with one set() call
+        # instead of paying Document.append bookkeeping per row
+        item_rows = []
         for row in customer_rows:
             try:
                 # Get item by ArticleNumber_Mandant (external article number)
-                article_nr = row.get('ArticleNumber_Mandant', '').strip()
-                item = frappe.get_all('Item', 
-                    filters={'custom_externe_artikelnummer': article_nr}, 
-                    fields=['name', 'item_name', 'description']
-                )[0]
-                
-                # Convert German number format
-                qty = convert_german_number(row.get('Amount', 0))
-                rate = convert_german_number(row.get('Price', 0))
-                amount = convert_german_number(row.get('TotalPrice', 0))
-                
-                if qty <= 0:
+                article_nr = row.art
+                item = items_by_article[article_nr]
+
+                # Numeric columns were already converted at parse time
+                if row.amount <= 0:
                     continue
-                
-                # Add item to invoice (without item-level discount)
-                invoice.append('items', {
+
+                # Item row without item-level discount
+                item_rows.append({
                     'item_code': item['name'],
                     'customer_item_code': article_nr,
                     'description': item.get('description') or item.get('item_name'),
-                    'qty': qty,
-                    'rate': rate,
-                    'amount': amount  # Original amount, discount will be applied at invoice level
+                    'qty': row.amount,
+                    'rate': row.price,
+                    'amount': row.total  # Original amount, discount will be applied at invoice level
                 })
-                items_added += 1
-                
+
             except Exception as e:
-                errors.append(f"Error adding item {article_nr} to invoice for customer {customer_nr}: {str(e)}")
+                errors.append(f"Error adding item {row.art} to invoice for customer {customer_nr}: {str(e)}")
                 continue
-        
-        if items_added == 0:
+
+        if not item_rows:
             return None  # No valid items added
-        
+
+        invoice.set('items', item_rows)
+
         # Apply customer discount at invoice level
         if customer_discount_percentage > 0:
             invoice.additional_discount_percentage = customer_discount_percentage
         
         # Add taxes with dynamic rate from settings
         try:
-            if not settings_doc.tax_account:
+            if tax_rate is None:
                 errors.append(f"No tax account configured for customer {customer_nr}")
             else:
-                tax_rate = get_dynamic_tax_rate(settings_doc)
-                
                 invoice.append('taxes', {
                     'charge_type': 'On Net Total',
                     'account_head': settings_doc.tax_account,
@@ -600,35 +760,64 @@ def create_wortmann_sales_invoice_safe(customer_nr, customer_rows, settings_doc,
                 
         except Exception as e:
             errors.append(f"Error adding tax to invoice for customer {customer_nr}: {str(e)}")
-        
-        # Calculate totals 
-        try:
-            invoice.run_method('calculate_taxes_and_totals')
-        except Exception as e:
-            errors.append(f"Error calculating totals for customer {customer_nr}: {str(e)}")
-        
-        # Check if invoice should be suppressed (zero amount)
-        if settings_doc.nullrechnungen_unterdruecken and flt(invoice.grand_total) == 0:
-            return None
-        
-        # Save invoice
+
+        # Check if invoice should be suppressed (zero amount). Totals are
+        # not calculated until insert() runs validate, so check the net
+        # amount of the built rows; the tax is a percentage of it, so a
+        # zero net means a zero grand total.
+        if settings_doc.nullrechnungen_unterdruecken:
+            net_total = sum(r['amount'] for r in item_rows) * (1 - customer_discount_percentage / 100)
+            if flt(net_total, 2) == 0:
+                return None
+
+        # Save invoice. insert() runs validate, which already calls
+        # calculate_taxes_and_totals - no need to run it twice. Customer,
+        # items and tax account were all pre-validated via the bulk maps
+        # and settings check, so link validation can be skipped.
+        invoice.flags.ignore_links = True
         invoice.insert(ignore_permissions=True)
-        
+
         return invoice
         
     except Exception as e:
         errors.append(f"Error creating invoice for customer {customer_nr}: {str(e)}")
         return None
 
-def get_customer_discount(customer_name, discount_table):
-    """Get customer discount percentage"""
-    try:
-        for row in discount_table:
-            if row.kundenname and row.kundenname.strip() == customer_name.strip():
-                return flt(row.rabatt_wert_in_prozent)
-    except Exception as e:
-        frappe.log_error(f"Error getting customer discount for {customer_name}: {str(e)}")
-    return 0
+def append_import_log(doc_name, saved_file_name, report):
+    """Write the import history and result child rows directly
+
+    Inserting the two rows with db_insert avoids re-validating and
+    re-saving the whole settings document (including all existing child
+    rows) on every import.
+    """
+    now = datetime.now()
+
+    history = frappe.get_doc({
+        'doctype': 'Wortmann Importhistorie',
+        'parent': doc_name,
+        'parenttype': 'CSV Import Wortmann Settings',
+        'parentfield': 'wortmann_importhistorie',
+        'idx': frappe.db.count('Wortmann Importhistorie', {'parent': doc_name}) + 1,
+        'importdatum': now,
+        'name_der_csv': saved_file_name  # Links to File doctype
+    })
+    history.name = frappe.generate_hash(length=10)
+    history.db_insert()
+
+    result = frappe.get_doc({
+        'doctype': 'Wortmann Importergebnis',
+        'parent': doc_name,
+        'parenttype': 'CSV Import Wortmann Settings',
+        'parentfield': 'wortmann_importergebnis',
+        'idx': frappe.db.count('Wortmann Importergebnis', {'parent': doc_name}) + 1,
+        'datum': now,
+        'name_der_csv': saved_file_name,  # Links to File doctype
+        'importergebnis': report
+    })
+    result.name = frappe.generate_hash(length=10)
+    result.db_insert()
+
+    frappe.clear_document_cache('CSV Import Wortmann Settings', doc_name)
 
 def generate_wortmann_report(licenses_before, licenses_after, invoices_created, errors, successful_customers):
     """Generate import report"""